@@ -1,21 +1,29 @@
+import functools
 from abc import ABC, abstractmethod
-from typing import Iterator, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import pytest
+import requests
+from eth_utils import event_abi_to_log_topic
+from web3 import HTTPProvider, Web3
 
 from starkware.cairo.lang.cairo_constants import DEFAULT_PRIME
 from starkware.eth.eth_test_utils import EthAccount, EthContract, EthReceipt, EthTestUtils
-from starkware.solidity.test_contracts.contracts import TestERC20
-from starkware.solidity.upgrade.contracts import Proxy
-from starkware.starknet.apps.starkgate.eth.contracts import StarknetERC20Bridge
-from starkware.starknet.apps.starkgate.eth.test_contracts import StarknetEthBridgeTester
 from starkware.starknet.solidity.starknet_test_utils import (
     UPGRADE_DELAY,
     add_implementation_and_upgrade,
 )
 
 
+@functools.lru_cache(maxsize=None)
 def str_to_felt(short_text: str) -> int:
+    if len(short_text) <= 8 and short_text.isascii():
+        # Short strings fit in a machine word, so the characters are packed directly.
+        felt = 0
+        for char in short_text:
+            felt = (felt << 8) | ord(char)
+        return felt
+
     felt = int.from_bytes(bytes(short_text, encoding="ascii"), "big")
     assert felt < DEFAULT_PRIME, f"{short_text} is too long"
     return felt
@@ -37,6 +45,23 @@ def token_name() -> int:
 
 
 ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+MAX_UINT256 = 2**256 - 1
+# Seconds.
+BATCH_REQUEST_TIMEOUT = 10
+ZERO_ADDRESS_PADDED32: bytes = bytes(32)
+
+
+def hex_to_bytes32(num: str) -> bytes:
+    """
+    Converts a HexStr that fits in 256 bits to a 32 bytes big endian array.
+    """
+    if num == ZERO_ADDRESS:
+        return ZERO_ADDRESS_PADDED32
+    if isinstance(num, str) and num.startswith("0x") and 2 < len(num) <= 66:
+        # Fast path for 0x-prefixed hex strings (e.g., addresses): decode the bytes directly.
+        # Anything else (e.g., bytes) goes through int() as before.
+        return bytes.fromhex(num[2:].rjust(64, "0"))
+    return int(num, 16).to_bytes(32, "big")
 
 
 def chain_hexes_to_bytes(hexes: List[str]) -> bytes:
@@ -44,10 +69,14 @@ def chain_hexes_to_bytes(hexes: List[str]) -> bytes:
     Chain arguments to one big endian bytes array.
     Support address (or other HexStr that fit in 256 bits), bytes and int (as 256 bits integer).
     """
-    result = bytes()
-    for num in hexes:
-        result += int(num, 16).to_bytes(32, "big")
-    return result
+    return b"".join(hex_to_bytes32(num) for num in hexes)
+
+
+def build_bridge_init_data(token_address: str, messaging_contract_address: str) -> bytes:
+    """
+    Returns the init data of a StarknetTokenBridge: [eic address, token, messaging contract].
+    """
+    return chain_hexes_to_bytes([ZERO_ADDRESS, token_address, messaging_contract_address])
 
 
 def wrap_contract(contract: EthContract, wrapper_address: str) -> EthContract:
@@ -62,12 +91,93 @@ def wrap_contract(contract: EthContract, wrapper_address: str) -> EthContract:
     )
 
 
+def make_batch_request(w3: Web3, calls: List[Tuple[str, list]]) -> list:
+    """
+    Sends several JSON-RPC requests, given as (method, params) pairs, to the node in a single
+    round-trip. Returns their results in the same order.
+    """
+    provider = w3.provider
+    assert isinstance(provider, HTTPProvider), "Batch requests are only supported over HTTP."
+    payload = [
+        {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+        for i, (method, params) in enumerate(calls)
+    ]
+    # web3 5.28 has no batch request API, so the batch is posted to the provider's endpoint
+    # directly (with the provider's request kwargs).
+    request_kwargs = {"timeout": BATCH_REQUEST_TIMEOUT, **provider.get_request_kwargs()}
+    responses = requests.post(provider.endpoint_uri, json=payload, **request_kwargs).json()
+    # A malformed batch is answered with a single error object, rather than a list.
+    assert isinstance(responses, list), f"Batch request failed: {responses}."
+    responses = sorted(responses, key=lambda response: response["id"])
+    errors = [response["error"] for response in responses if "error" in response]
+    assert len(errors) == 0, f"Batch request failed: {errors}."
+    return [response["result"] for response in responses]
+
+
+def send_transactions_batch(w3: Web3, transactions: List[dict]):
+    """
+    Sends the given (already encoded) transactions in one round-trip, and fetches all their
+    receipts in another. This assumes the node mines transactions instantly (as the test node
+    does); transactions that are still pending are waited for one by one.
+    """
+    tx_hashes = make_batch_request(
+        w3=w3, calls=[("eth_sendTransaction", [transaction]) for transaction in transactions]
+    )
+    receipts = make_batch_request(
+        w3=w3, calls=[("eth_getTransactionReceipt", [tx_hash]) for tx_hash in tx_hashes]
+    )
+    for transaction, tx_hash, receipt in zip(transactions, tx_hashes, receipts):
+        if receipt is None:
+            # The transaction was not mined yet.
+            status = w3.eth.wait_for_transaction_receipt(tx_hash)["status"]
+        else:
+            status = int(receipt["status"], 16)
+        assert status == 1, f"Transaction {transaction} failed."
+
+
 @pytest.fixture(scope="session")
 def eth_test_utils() -> Iterator[EthTestUtils]:
     with EthTestUtils.context_manager() as val:
         yield val
 
 
+def take_eth_snapshot(w3: Web3) -> str:
+    """
+    Takes a snapshot of the L1 chain state and returns its id.
+    """
+    response = w3.provider.make_request(method="evm_snapshot", params=[])  # type: ignore
+    # Session-scoped contracts rely on snapshots to be reset between tests, so silently skipping
+    # the snapshot would leak state between tests.
+    assert "error" not in response, f"The L1 node doesn't support snapshots: {response['error']}."
+    return response["result"]
+
+
+def revert_to_eth_snapshot(w3: Web3, snapshot_id: str):
+    """
+    Reverts the L1 chain state to the given snapshot. Note that the snapshot is consumed.
+    """
+    response = w3.provider.make_request(method="evm_revert", params=[snapshot_id])  # type: ignore
+    assert response.get("result") is True, f"Failed to revert to snapshot {snapshot_id}."
+
+
+@pytest.fixture(autouse=True)
+def revert_eth_state(request) -> Iterator[None]:
+    """
+    Reverts the L1 chain to its state from before the test, so that session-scoped contracts
+    (e.g., the token bridges) start each test from a clean state.
+    Tests that don't use the L1 chain are left untouched.
+    """
+    if "eth_test_utils" not in request.fixturenames:
+        yield
+        return
+
+    # Session-scoped fixtures are set up before this one, so their deployments are kept.
+    w3 = request.getfixturevalue("eth_test_utils").w3
+    snapshot_id = take_eth_snapshot(w3=w3)
+    yield
+    revert_to_eth_snapshot(w3=w3, snapshot_id=snapshot_id)
+
+
 class TokenBridgeWrapper(ABC):
     """
     Wraps a StarknetTokenBridge so that all deriving contracts of it can be called with the same
@@ -84,6 +194,10 @@ class TokenBridgeWrapper(ABC):
         eth_test_utils: EthTestUtils,
         init_data: bytes,
     ):
+        # Contract modules load their compiled json on import, so they are imported only when
+        # needed.
+        from starkware.solidity.upgrade.contracts import Proxy
+
         self.default_user = eth_test_utils.accounts[0]
         self.non_default_user = eth_test_utils.accounts[1]
         self.contract = self.default_user.deploy(compiled_bridge_contract)
@@ -96,6 +210,12 @@ class TokenBridgeWrapper(ABC):
             governor=self.default_user,
         )
         self.contract = wrap_contract(contract=self.contract, wrapper_address=proxy.address)
+        # Contract functions are resolved once, rather than on every call, as deposits are
+        # issued repeatedly by the tests.
+        self._deposit_function = self.contract.deposit
+        log_deposit_event = self.contract.w3_contract.events.LogDeposit()
+        self._log_deposit_topic = event_abi_to_log_topic(log_deposit_event.abi)
+        self._process_log_deposit = log_deposit_event.processLog
 
     @abstractmethod
     def deposit(
@@ -119,8 +239,11 @@ class TokenBridgeWrapper(ABC):
             )
 
     def get_deposit_fee(self, receipt: EthReceipt) -> int:
-        logs = self.contract.w3_contract.events.LogDeposit().processReceipt(receipt.w3_tx_receipt)
-        return 0 if len(logs) == 0 else logs[0].args.fee
+        # Only logs with the LogDeposit topic are decoded.
+        for log in receipt.w3_tx_receipt["logs"]:
+            if len(log["topics"]) > 0 and log["topics"][0] == self._log_deposit_topic:
+                return self._process_log_deposit(log).args.fee
+        return 0
 
     def deposit_cancel_request(
         self, amount: int, l2_recipient: int, nonce: int, user: Optional[EthAccount] = None
@@ -140,6 +263,31 @@ class TokenBridgeWrapper(ABC):
             amount, l2_recipient, nonce, transact_args={"from": user}
         )
 
+    def get_balances_snapshot(self) -> Tuple[int, int, int]:
+        """
+        Returns the balances of the default user, the non-default user and the bridge, fetched in a
+        single round-trip.
+        """
+        addresses = (
+            self.default_user.address,
+            self.non_default_user.address,
+            self.contract.address,
+        )
+        results = make_batch_request(
+            w3=self.contract.w3, calls=[self._get_balance_call(address) for address in addresses]
+        )
+        default_user_balance, non_default_user_balance, bridge_balance = (
+            int(result, 16) for result in results
+        )
+        return default_user_balance, non_default_user_balance, bridge_balance
+
+    @abstractmethod
+    def _get_balance_call(self, address: str) -> Tuple[str, list]:
+        """
+        Returns a JSON-RPC call, as a (method, params) pair, whose result is the balance of the
+        given address (as a hex).
+        """
+
     @abstractmethod
     def get_account_balance(self, account: EthAccount) -> int:
         pass
@@ -161,29 +309,53 @@ class TokenBridgeWrapper(ABC):
 
 class ERC20BridgeWrapper(TokenBridgeWrapper):
     TRANSACTION_COSTS_BOUND: int = 0
+    # A bound on the gas of a setBalance transaction (two storage writes).
+    SET_BALANCE_GAS: int = 200000
+    # The token balance each of the users starts with.
+    INITIAL_BALANCE: int = 10**20
 
     def __init__(
         self,
         mock_starknet_messaging_contract: EthContract,
         eth_test_utils: EthTestUtils,
     ):
+        from starkware.solidity.test_contracts.contracts import TestERC20
+        from starkware.starknet.apps.starkgate.eth.contracts import StarknetERC20Bridge
+
         self.mock_erc20_contract = eth_test_utils.accounts[0].deploy(TestERC20)
 
         super().__init__(
             compiled_bridge_contract=StarknetERC20Bridge,
             eth_test_utils=eth_test_utils,
-            init_data=chain_hexes_to_bytes(
-                [
-                    ZERO_ADDRESS,
-                    self.mock_erc20_contract.address,
-                    mock_starknet_messaging_contract.address,
-                ]
+            init_data=build_bridge_init_data(
+                token_address=self.mock_erc20_contract.address,
+                messaging_contract_address=mock_starknet_messaging_contract.address,
             ),
         )
 
-        INITIAL_BALANCE = 10**20
+        self._balance_of_function = self.mock_erc20_contract.balanceOf
+        # The calldata of setBalance and balanceOf is built from their selectors directly, rather
+        # than encoding the ABI on every call.
+        self._set_balance_selector = self.mock_erc20_contract.w3_contract.encodeABI(
+            fn_name="setBalance", args=[ZERO_ADDRESS, 0]
+        )[:10]
+        self._balance_of_selector = self.mock_erc20_contract.w3_contract.encodeABI(
+            fn_name="balanceOf", args=[ZERO_ADDRESS]
+        )[:10]
+
+        # Allow the bridge to transfer the users' tokens once, so that deposits don't need a
+        # preceding approve transaction.
         for account in (self.default_user, self.non_default_user):
-            self.set_account_balance(account=account, amount=INITIAL_BALANCE)
+            self.mock_erc20_contract.approve.transact(
+                self.contract.address, MAX_UINT256, transact_args={"from": account}
+            )
+
+        self.set_balances(
+            {
+                account.address: self.INITIAL_BALANCE
+                for account in (self.default_user, self.non_default_user)
+            }
+        )
 
     def deposit(
         self,
@@ -192,20 +364,37 @@ class ERC20BridgeWrapper(TokenBridgeWrapper):
         fee: int = 0,
         user: Optional[EthAccount] = None,
     ) -> EthReceipt:
+        """
+        Deposit tokens into the bridge. Only the default and non-default users approved the bridge
+        (in __init__), so only they can deposit.
+        """
         if user is None:
             user = self.default_user
-        self.mock_erc20_contract.approve.transact(
-            self.contract.address, amount, transact_args={"from": user}
-        )
-        return self.contract.deposit.transact(
+        assert user.address in (
+            self.default_user.address,
+            self.non_default_user.address,
+        ), f"User {user.address} didn't approve the bridge."
+        return self._deposit_function.transact(
             amount, l2_recipient, transact_args={"from": user, "value": fee}
         )
 
+    def _get_balance_call(self, address: str) -> Tuple[str, list]:
+        return (
+            "eth_call",
+            [
+                {
+                    "to": self.mock_erc20_contract.address,
+                    "data": self._balance_of_selector + hex_to_bytes32(address).hex(),
+                },
+                "latest",
+            ],
+        )
+
     def get_account_balance(self, account: EthAccount) -> int:
-        return self.mock_erc20_contract.balanceOf.call(account.address)
+        return self._balance_of_function.call(account.address)
 
     def get_bridge_balance(self) -> int:
-        return self.mock_erc20_contract.balanceOf.call(self.contract.address)
+        return self._balance_of_function.call(self.contract.address)
 
     def set_account_balance(self, account: EthAccount, amount: int):
         self.mock_erc20_contract.setBalance.transact(account.address, amount)
@@ -213,13 +402,40 @@ class ERC20BridgeWrapper(TokenBridgeWrapper):
     def set_bridge_balance(self, amount: int):
         self.mock_erc20_contract.setBalance.transact(self.contract.address, amount)
 
+    def set_balances(self, balances: Dict[str, int]):
+        """
+        Sets the balances of several addresses, batching the transactions.
+        """
+        send_transactions_batch(
+            w3=self.mock_erc20_contract.w3,
+            transactions=[
+                {
+                    "from": self.default_user.address,
+                    "to": self.mock_erc20_contract.address,
+                    # Batched transactions aren't estimated, so the gas must be given explicitly.
+                    "gas": hex(self.SET_BALANCE_GAS),
+                    "data": self._set_balance_selector
+                    + hex_to_bytes32(address).hex()
+                    + amount.to_bytes(32, "big").hex(),
+                }
+                for address, amount in balances.items()
+            ],
+        )
+
     def get_tx_cost(self, tx_receipt: EthReceipt) -> int:
         return 0
 
     def reset_balances(self):
-        self.set_bridge_balance(amount=0)
-        for account in (self.default_user, self.non_default_user):
-            self.set_account_balance(account=account, amount=0)
+        self.set_balances(
+            {
+                address: 0
+                for address in (
+                    self.contract.address,
+                    self.default_user.address,
+                    self.non_default_user.address,
+                )
+            }
+        )
 
 
 class EthBridgeWrapper(TokenBridgeWrapper):
@@ -231,11 +447,15 @@ class EthBridgeWrapper(TokenBridgeWrapper):
         mock_starknet_messaging_contract: EthContract,
         eth_test_utils: EthTestUtils,
     ):
+        from starkware.starknet.apps.starkgate.eth.test_contracts import StarknetEthBridgeTester
+
         super().__init__(
             compiled_bridge_contract=StarknetEthBridgeTester,
             eth_test_utils=eth_test_utils,
-            init_data=chain_hexes_to_bytes(
-                [ZERO_ADDRESS, ZERO_ADDRESS, mock_starknet_messaging_contract.address]
+            # The ETH bridge has no token contract.
+            init_data=build_bridge_init_data(
+                token_address=ZERO_ADDRESS,
+                messaging_contract_address=mock_starknet_messaging_contract.address,
             ),
         )
         self.eth_test_utils = eth_test_utils
@@ -249,10 +469,13 @@ class EthBridgeWrapper(TokenBridgeWrapper):
     ) -> EthReceipt:
         if user is None:
             user = self.default_user
-        return self.contract.deposit.transact(
+        return self._deposit_function.transact(
             amount, l2_recipient, transact_args={"from": user, "value": amount + fee}
         )
 
+    def _get_balance_call(self, address: str) -> Tuple[str, list]:
+        return ("eth_getBalance", [address, "latest"])
+
     def get_account_balance(self, account: EthAccount) -> int:
         return account.balance
 
@@ -266,7 +489,14 @@ class EthBridgeWrapper(TokenBridgeWrapper):
         return tx_receipt.get_cost() + self.get_deposit_fee(tx_receipt)
 
 
-@pytest.fixture(params=[ERC20BridgeWrapper, EthBridgeWrapper])
+# Each wrapper type is deployed once per xdist worker, so its tests are grouped to the same worker.
+@pytest.fixture(
+    scope="session",
+    params=[
+        pytest.param(ERC20BridgeWrapper, marks=pytest.mark.xdist_group("erc20_bridge")),
+        pytest.param(EthBridgeWrapper, marks=pytest.mark.xdist_group("eth_bridge")),
+    ],
+)
 def token_bridge_wrapper(
     request, mock_starknet_messaging_contract: EthContract, eth_test_utils: EthTestUtils
 ) -> TokenBridgeWrapper:
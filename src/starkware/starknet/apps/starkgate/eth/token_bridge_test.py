@@ -19,7 +19,7 @@ WITHDRAW_AMOUNT = 3
 MESSAGE_CANCEL_DELAY = 1000
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def mock_starknet_messaging_contract(eth_test_utils: EthTestUtils) -> EthContract:
     return eth_test_utils.accounts[0].deploy(MockStarknetMessaging, MESSAGE_CANCEL_DELAY)
 
@@ -29,8 +29,9 @@ def setup_contracts(
     initial_bridge_balance: int = INITIAL_BRIDGE_BALANCE,
 ):
     """
-    Setups balances and allowances for the bridge and for a given user. The default user is the
-    default account.
+    Setups the bridge balance and configuration. Note that ERC20 bridge wrappers already have an
+    unlimited allowance from both users (see ERC20BridgeWrapper), so exact-amount allowances are
+    only checked by test_deposit_with_exact_allowance.
     """
     token_bridge_wrapper.set_bridge_balance(initial_bridge_balance)
     token_bridge_wrapper.contract.setL2TokenBridge.transact(L2_TOKEN_CONTRACT)
@@ -149,6 +150,31 @@ def test_positive_flow(
     assert eth_test_utils.get_balance(mock_starknet_messaging_contract.address) == fee
 
 
+def test_get_balances_snapshot(token_bridge_wrapper: TokenBridgeWrapper):
+    setup_contracts(token_bridge_wrapper=token_bridge_wrapper)
+    if isinstance(token_bridge_wrapper, ERC20BridgeWrapper):
+        initial_default_user_balance = ERC20BridgeWrapper.INITIAL_BALANCE
+        initial_non_default_user_balance = ERC20BridgeWrapper.INITIAL_BALANCE
+    else:
+        # ETH balances depend on the gas spent so far, so they are taken before the deposit.
+        initial_default_user_balance = token_bridge_wrapper.get_account_balance(
+            token_bridge_wrapper.default_user
+        )
+        initial_non_default_user_balance = token_bridge_wrapper.get_account_balance(
+            token_bridge_wrapper.non_default_user
+        )
+
+    deposit_receipt = token_bridge_wrapper.deposit(amount=DEPOSIT_AMOUNT, l2_recipient=L2_RECIPIENT)
+
+    assert token_bridge_wrapper.get_balances_snapshot() == (
+        initial_default_user_balance
+        - DEPOSIT_AMOUNT
+        - token_bridge_wrapper.get_tx_cost(deposit_receipt),
+        initial_non_default_user_balance,
+        INITIAL_BRIDGE_BALANCE + DEPOSIT_AMOUNT,
+    )
+
+
 @pytest.mark.parametrize("fee", [0, 100], ids=["no_fee", "with_fee"])
 def test_deposit_events(token_bridge_wrapper: TokenBridgeWrapper, fee: int):
     deposit_filter = token_bridge_wrapper.contract.w3_contract.events.LogDeposit.createFilter(
@@ -307,6 +333,23 @@ def test_withdraw_from_another_address(
     assert token_bridge_wrapper.get_bridge_balance() == INITIAL_BRIDGE_BALANCE - WITHDRAW_AMOUNT
 
 
+@pytest.mark.parametrize("token_bridge_wrapper", [ERC20BridgeWrapper], indirect=True)
+def test_deposit_with_exact_allowance(token_bridge_wrapper: ERC20BridgeWrapper):
+    setup_contracts(token_bridge_wrapper=token_bridge_wrapper)
+    default_user = token_bridge_wrapper.default_user
+    token = token_bridge_wrapper.mock_erc20_contract
+    bridge = token_bridge_wrapper.contract
+
+    # Replace the unlimited allowance given by the wrapper with the exact deposit amount.
+    token.approve.transact(bridge.address, DEPOSIT_AMOUNT, transact_args={"from": default_user})
+    bridge.deposit.transact(DEPOSIT_AMOUNT, L2_RECIPIENT, transact_args={"from": default_user})
+    assert token.allowance.call(default_user.address, bridge.address) == 0
+    assert token_bridge_wrapper.get_bridge_balance() == INITIAL_BRIDGE_BALANCE + DEPOSIT_AMOUNT
+
+    with pytest.raises(EthRevertException, match="transfer exceeds allowance"):
+        bridge.deposit.call(DEPOSIT_AMOUNT, L2_RECIPIENT, transact_args={"from": default_user})
+
+
 # We can't cause a situation where the global ETH supply is 2**256.
 @pytest.mark.parametrize("token_bridge_wrapper", [ERC20BridgeWrapper], indirect=True)
 def test_deposit_overflow(token_bridge_wrapper: TokenBridgeWrapper):
@@ -3,7 +3,11 @@ import pytest_asyncio
 
 from starkware.eth.eth_test_utils import EthContract, EthTestUtils
 from starkware.starknet.apps.starkgate.cairo.contracts import bridge_contract_class
-from starkware.starknet.apps.starkgate.conftest import TokenBridgeWrapper
+from starkware.starknet.apps.starkgate.conftest import (
+    ERC20BridgeWrapper,
+    EthBridgeWrapper,
+    TokenBridgeWrapper,
+)
 from starkware.starknet.solidity.starknet_test_utils import Uint256
 from starkware.starknet.std_contracts.ERC20.contracts import erc20_contract_class
 from starkware.starknet.std_contracts.upgradability_proxy.contracts import proxy_contract_class
@@ -34,6 +38,18 @@ def mock_starknet_messaging_contract(postman) -> EthContract:
     return postman.mock_starknet_messaging_contract
 
 
+# Overrides the session-scoped conftest fixture, as the L1 bridge must be connected to the
+# messaging contract of the (function-scoped) postman.
+@pytest.fixture(params=[ERC20BridgeWrapper, EthBridgeWrapper])
+def token_bridge_wrapper(
+    request, mock_starknet_messaging_contract: EthContract, eth_test_utils: EthTestUtils
+) -> TokenBridgeWrapper:
+    return request.param(
+        mock_starknet_messaging_contract=mock_starknet_messaging_contract,
+        eth_test_utils=eth_test_utils,
+    )
+
+
 @pytest_asyncio.fixture
 async def l2_token_contract(
     postman, token_name, token_symbol, token_decimals, l2_token_bridge_contract